@@ -1,12 +1,9 @@
 # Fichier : aggregations.py
-import pymongo
 from datetime import datetime
-
-# Connexion à MongoDB
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["ecommerce"]
+from database import get_db, ANALYTIQUE, LISTE, MAX_TIME_MS
 
 def ventes_par_periode(start_date, end_date):
+    db = get_db(ANALYTIQUE)
     pipeline = [
         {"$match": {"date": {"$gte": start_date, "$lte": end_date}}},
         {"$group": {
@@ -16,45 +13,36 @@ def ventes_par_periode(start_date, end_date):
         }},
         {"$sort": {"_id": 1}}
     ]
-    return list(db.commandes.aggregate(pipeline))
+    return list(db.commandes.aggregate(pipeline, maxTimeMS=MAX_TIME_MS[ANALYTIQUE]))
 
 def ventes_par_produit():
+    db = get_db(ANALYTIQUE)
+    # Les lignes de commande portent le nom et le prix facturé : pas de $lookup
     pipeline = [
         {"$unwind": "$produits"},
-        {"$lookup": {
-            "from": "produits",
-            "localField": "produits.produit_id",
-            "foreignField": "_id",
-            "as": "produit_info"
-        }},
-        {"$unwind": "$produit_info"},
         {"$group": {
-            "_id": "$produit_info.nom",
-            "total_ventes": {"$sum": {"$multiply": ["$produits.quantite", "$produit_info.prix"]}},
+            "_id": "$produits.nom",
+            "total_ventes": {"$sum": {"$multiply": ["$produits.quantite", "$produits.prix_unitaire"]}},
             "quantite_vendue": {"$sum": "$produits.quantite"}
         }}
     ]
-    return list(db.commandes.aggregate(pipeline))
+    return list(db.commandes.aggregate(pipeline, maxTimeMS=MAX_TIME_MS[ANALYTIQUE]))
 
 def ventes_par_categorie():
+    db = get_db(ANALYTIQUE)
     pipeline = [
         {"$unwind": "$produits"},
-        {"$lookup": {
-            "from": "produits",
-            "localField": "produits.produit_id",
-            "foreignField": "_id",
-            "as": "produit_info"
-        }},
-        {"$unwind": "$produit_info"},
         {"$group": {
-            "_id": "$produit_info.categorie",
-            "total_ventes": {"$sum": {"$multiply": ["$produits.quantite", "$produit_info.prix"]}}
+            "_id": "$produits.categorie",
+            "total_ventes": {"$sum": {"$multiply": ["$produits.quantite", "$produits.prix_unitaire"]}}
         }}
     ]
-    return list(db.commandes.aggregate(pipeline))
+    return list(db.commandes.aggregate(pipeline, maxTimeMS=MAX_TIME_MS[ANALYTIQUE]))
 
 def calculer_metrics(start_date, end_date):
-    commandes = db.commandes.find({"date": {"$gte": start_date, "$lte": end_date}})
+    db = get_db(ANALYTIQUE)
+    commandes = db.commandes.find({"date": {"$gte": start_date, "$lte": end_date}},
+                                  max_time_ms=MAX_TIME_MS[ANALYTIQUE])
     commandes_list = list(commandes)
     total_revenus = sum(c["montant_total"] for c in commandes_list)
     nombre_commandes = len(commandes_list)
@@ -66,7 +54,8 @@ def calculer_metrics(start_date, end_date):
     }
 
 def stocks_restants():
-    return list(db.produits.find({}, {"nom": 1, "stock": 1, "categorie": 1, "_id": 0}))
+    return list(get_db().stocks.find({}, {"nom": 1, "stock": 1, "categorie": 1, "_id": 0},
+                                     max_time_ms=MAX_TIME_MS[LISTE]))
 
 # Tester avec les nouvelles dates
 if __name__ == "__main__":
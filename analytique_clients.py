@@ -0,0 +1,137 @@
+# Fichier : analytique_clients.py
+# Statistiques par client précalculées dans la collection clients_stats : récence, fréquence,
+# montant, première / dernière commande, catégories préférées et segment RFM.
+import math
+
+import pandas as pd
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from database import get_db, PONCTUELLE, LISTE, MAX_TIME_MS
+
+NB_TOP_CATEGORIES = 3
+TAILLE_LOT = 1000
+SEGMENTS = ["Champions", "Fidèles", "Nouveaux", "Potentiels", "À risque", "Perdus"]
+# Critères de classement des clients : champ -> sens du tri
+CLASSEMENTS = {"montant": DESCENDING, "frequence": DESCENDING, "recence": ASCENDING}
+
+
+def creer_index_clients(db):
+    for champ, sens in CLASSEMENTS.items():
+        db.clients_stats.create_index([(champ, sens)])
+        db.clients_stats.create_index([("segment", ASCENDING), (champ, sens)])
+
+
+def segment_rfm(score_r, score_f):
+    if score_r >= 4 and score_f >= 4:
+        return "Champions"
+    if score_f >= 4:
+        return "Fidèles"
+    if score_r >= 4 and score_f <= 1:
+        return "Nouveaux"
+    if score_r >= 3:
+        return "Potentiels"
+    if score_f >= 3:
+        return "À risque"
+    return "Perdus"
+
+
+def score_quintile(valeurs):
+    # Note de 1 à 5 selon le quintile du rang. Le rang 'min' donne la même note aux valeurs
+    # égales (la plupart des clients ont 1 ou 2 commandes) : la note ne dépend pas de l'ordre
+    # de lecture des clients, et évite les bornes dupliquées de qcut.
+    return (valeurs.rank(method='min', pct=True) * 5).map(math.ceil).astype(int)
+
+
+def agreger_clients(db, match):
+    # Fréquence, montant et dates de commande par client
+    db.commandes.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$client_id",
+            "frequence": {"$sum": 1},
+            "montant": {"$sum": "$montant_total"},
+            "premiere_commande": {"$min": "$date"},
+            "derniere_commande": {"$max": "$date"}
+        }},
+        {"$merge": {"into": "clients_stats", "whenMatched": "merge", "whenNotMatched": "insert"}}
+    ])
+    # Catégories les plus achetées (montant facturé), à partir des lignes dénormalisées
+    db.commandes.aggregate([
+        {"$match": match},
+        {"$unwind": "$produits"},
+        {"$group": {
+            "_id": {"client_id": "$client_id", "categorie": "$produits.categorie"},
+            "montant": {"$sum": {"$multiply": ["$produits.quantite", "$produits.prix_unitaire"]}}
+        }},
+        {"$sort": {"montant": -1}},
+        {"$group": {"_id": "$_id.client_id", "top_categories": {"$push": "$_id.categorie"}}},
+        {"$project": {"top_categories": {"$slice": ["$top_categories", NB_TOP_CATEGORIES]}}},
+        {"$merge": {"into": "clients_stats", "whenMatched": "merge", "whenNotMatched": "insert"}}
+    ])
+
+
+def noter_clients(db):
+    # Les notes RFM sont relatives à l'ensemble des clients : on les recalcule sur la petite
+    # collection clients_stats (un document par client), sans relire les commandes
+    champs = ["frequence", "montant", "derniere_commande", "recence", "score_r", "score_f", "score_m", "segment"]
+    stats = pd.DataFrame(list(db.clients_stats.find({}, {champ: 1 for champ in champs})))
+    if stats.empty:
+        return 0
+    stats = stats.reindex(columns=["_id"] + champs)
+
+    # Récence en jours par rapport à la dernière commande enregistrée (données historiques)
+    derniere = pd.to_datetime(stats['derniere_commande'])
+    nouveau = pd.DataFrame({"_id": stats['_id']})
+    nouveau['recence'] = (derniere.max() - derniere).dt.days
+    nouveau['score_r'] = score_quintile(-nouveau['recence'])
+    nouveau['score_f'] = score_quintile(stats['frequence'])
+    nouveau['score_m'] = score_quintile(stats['montant'])
+    nouveau['segment'] = [segment_rfm(r, f) for r, f in zip(nouveau['score_r'], nouveau['score_f'])]
+
+    colonnes = ["recence", "score_r", "score_f", "score_m", "segment"]
+    modifies = (nouveau[colonnes] != stats[colonnes]).any(axis=1)
+    operations = [
+        UpdateOne({"_id": ligne['_id']}, {"$set": {
+            "recence": int(ligne['recence']),
+            "score_r": int(ligne['score_r']),
+            "score_f": int(ligne['score_f']),
+            "score_m": int(ligne['score_m']),
+            "rfm": f"{ligne['score_r']}{ligne['score_f']}{ligne['score_m']}",
+            "segment": ligne['segment']
+        }})
+        for ligne in nouveau[modifies].to_dict('records')
+    ]
+    for debut in range(0, len(operations), TAILLE_LOT):
+        db.clients_stats.bulk_write(operations[debut:debut + TAILLE_LOT], ordered=False)
+    return len(operations)
+
+
+def calculer_clients_stats(db):
+    # Calcul complet, à l'import
+    db.clients_stats.drop()
+    creer_index_clients(db)
+    agreger_clients(db, {"date": {"$ne": None}})
+    noter_clients(db)
+    return db.clients_stats.count_documents({})
+
+
+def rafraichir_clients(db, client_ids):
+    # Mise à jour incrémentale après l'ingestion de nouvelles commandes : seuls les clients
+    # concernés sont réagrégés (index client_id), puis les notes sont recalculées
+    client_ids = list(set(client_ids))
+    if client_ids:
+        agreger_clients(db, {"client_id": {"$in": client_ids}, "date": {"$ne": None}})
+        noter_clients(db)
+    return len(client_ids)
+
+
+def stats_client(db, client_id):
+    return db.clients_stats.find_one({"_id": client_id}, max_time_ms=MAX_TIME_MS[PONCTUELLE])
+
+
+def classer_clients(db, segment=None, tri="montant", limite=20):
+    filtre = {} if segment is None else {"segment": segment}
+    return list(db.clients_stats.find(filtre, max_time_ms=MAX_TIME_MS[LISTE]).sort(tri, CLASSEMENTS[tri]).limit(limite))
+
+
+if __name__ == "__main__":
+    print(f"Clients analysés : {calculer_clients_stats(get_db())}")
@@ -1,16 +1,15 @@
 # Fichier : api.py
-from fastapi import FastAPI
-from pymongo import MongoClient
+from fastapi import FastAPI, HTTPException, Query
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional
 from pydantic import BaseModel
+from cache import cache, CACHE_EXPIRE
+from database import get_db, ANALYTIQUE, LISTE, MAX_TIME_MS
+from stocks import alertes_stock_faible, SEUIL_STOCK_FAIBLE
+from analytique_clients import stats_client, classer_clients, CLASSEMENTS
 
 app = FastAPI()
 
-# Connexion à MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["ecommerce"]
-
 
 class VentesQuery(BaseModel):
     client_id: Optional[int] = None
@@ -21,27 +20,33 @@ class VentesQuery(BaseModel):
 
 @app.get("/ventes")
 def get_ventes(query: VentesQuery):
+    return calculer_ventes(query.client_id, query.start_date, query.end_date, query.produit_id)
+
+
+# Résultats mis en cache, partagés entre les workers de l'API
+@cache.memoize(name='api.ventes', expire=CACHE_EXPIRE)
+def calculer_ventes(client_id, start_date, end_date, produit_id):
     filters = {}
-    if query.client_id:
-        filters['client_id'] = query.client_id
-    if query.start_date and query.end_date:
+    if client_id:
+        filters['client_id'] = client_id
+    if start_date and end_date:
         filters['date'] = {
-            '$gte': datetime.fromisoformat(query.start_date),
-            '$lte': datetime.fromisoformat(query.end_date)
+            '$gte': datetime.fromisoformat(start_date),
+            '$lte': datetime.fromisoformat(end_date)
         }
 
-    commandes = list(db.commandes.find(filters))
+    db = get_db(ANALYTIQUE)
+    commandes = list(db.commandes.find(filters, max_time_ms=MAX_TIME_MS[ANALYTIQUE]))
     total_revenus = sum(c['montant_total'] for c in commandes)
     panier_moyen = total_revenus / len(commandes) if commandes else 0
 
     categorie_data = {}
     for commande in commandes:
         for produit in commande['produits']:
-            if query.produit_id and produit['produit_id'] != query.produit_id:
+            if produit_id and produit['produit_id'] != produit_id:
                 continue
-            prod = db.produits.find_one({'_id': produit['produit_id']})
-            cat = prod['categorie']
-            montant = prod['prix'] * produit['quantite']
+            cat = produit['categorie']
+            montant = produit['prix_unitaire'] * produit['quantite']
             categorie_data[cat] = categorie_data.get(cat, 0) + montant
 
     return {
@@ -53,9 +58,45 @@ def get_ventes(query: VentesQuery):
 
 
 @app.get("/stocks")
+@cache.memoize(name='api.stocks', expire=CACHE_EXPIRE)
 def get_stocks():
-    produits = list(db.produits.find())
+    # Solde courant tenu par le registre des stocks (ventes déduites)
+    stocks = list(get_db().stocks.find({}, {"nom": 1, "stock": 1, "categorie": 1}, max_time_ms=MAX_TIME_MS[LISTE]))
     return [
-        {"nom": p['nom'], "stock": p['stock'], "categorie": p['categorie']}
-        for p in produits
-    ]
\ No newline at end of file
+        {"nom": s['nom'], "stock": s['stock'], "categorie": s['categorie']}
+        for s in stocks
+    ]
+
+
+@app.get("/stocks/alertes")
+def get_alertes_stock(seuil: int = SEUIL_STOCK_FAIBLE):
+    return [
+        {"produit_id": s['_id'], "nom": s['nom'], "stock": s['stock'], "categorie": s['categorie']}
+        for s in alertes_stock_faible(get_db(), seuil)
+    ]
+
+
+def formater_stats_client(stats):
+    stats['client_id'] = stats.pop('_id')
+    return stats
+
+
+# Taille maximale d'un classement : au-delà, la réponse n'est plus une lecture bornée
+LIMITE_CLASSEMENT_MAX = 500
+
+
+@app.get("/clients/stats")
+def get_clients_stats(segment: Optional[str] = None, tri: str = "montant",
+                      limite: Annotated[int, Query(ge=1, le=LIMITE_CLASSEMENT_MAX)] = 20):
+    # Classement des clients (un segment RFM ou tous) par montant, fréquence ou récence
+    if tri not in CLASSEMENTS:
+        raise HTTPException(status_code=400, detail=f"Tri inconnu : {tri} ({', '.join(CLASSEMENTS)})")
+    return [formater_stats_client(s) for s in classer_clients(get_db(), segment, tri, limite)]
+
+
+@app.get("/clients/{client_id}/stats")
+def get_client_stats(client_id: int):
+    stats = stats_client(get_db(), client_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Client inconnu : {client_id}")
+    return formater_stats_client(stats)
@@ -0,0 +1,24 @@
+# Fichier : cache.py
+import os
+import tempfile
+
+import diskcache
+from database import NOM_BASE
+
+# Cache partagé entre tous les processus workers (catalogue, résultats, figures).
+# diskcache repose sur SQLite : les workers d'une même machine lisent et écrivent
+# le même répertoire, un cache chaud n'est donc pas dupliqué dans chaque processus.
+# Un répertoire par base : des instances sur des bases différentes ne partagent pas leurs résultats.
+CACHE_DIR = os.environ.get("ECOMMERCE_CACHE_DIR", os.path.join(tempfile.gettempdir(), f"ecommerce_cache_{NOM_BASE}"))
+CACHE_EXPIRE = int(os.environ.get("ECOMMERCE_CACHE_EXPIRE", 600))  # secondes
+
+cache = diskcache.Cache(CACHE_DIR)
+
+# Stockage des tâches des callbacks Dash exécutés en arrière-plan (progression,
+# résultats, annulation). Séparé du cache de données : vider_cache() n'y touche pas.
+callback_cache = diskcache.Cache(os.path.join(CACHE_DIR, "callbacks"))
+
+
+def vider_cache():
+    # À appeler après toute modification des données (import, migration...)
+    cache.clear()
@@ -0,0 +1,103 @@
+# Fichier : categories.py
+# Classification des produits en catégories à partir de règles mot-clé -> catégorie
+# définies dans un fichier de configuration (categories.json par défaut).
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+from pymongo import UpdateOne, UpdateMany
+from cache import vider_cache
+from database import get_db
+from analytique_clients import rafraichir_clients
+
+FICHIER_REGLES = os.environ.get(
+    "ECOMMERCE_CATEGORIES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "categories.json")
+)
+CATEGORIE_PAR_DEFAUT = "Divers"
+TAILLE_LOT = 1000
+
+
+class ClassifieurCategories:
+    def __init__(self, regles, defaut=CATEGORIE_PAR_DEFAUT):
+        # regles : liste ordonnée de (catégorie, mots-clés) ; comme dans l'ancien
+        # deduce_category, la première règle dont un mot-clé apparaît l'emporte
+        self.defaut = defaut
+        self.categories = []
+        self.rang_mot = {}
+        for rang, (categorie, mots_cles) in enumerate(regles):
+            self.categories.append(categorie)
+            for mot in mots_cles:
+                self.rang_mot.setdefault(mot.lower(), rang)
+
+        # Tous les mots-clés sont compilés en une seule expression régulière. Le lookahead
+        # teste chaque position du texte, et l'alternative est ordonnée par priorité de
+        # règle : le mot retenu à une position est toujours le plus prioritaire qui y
+        # commence, le minimum sur toutes les positions donne donc la bonne règle.
+        mots = sorted(self.rang_mot, key=lambda m: (self.rang_mot[m], -len(m)))
+        self.regex = re.compile("(?=(" + "|".join(re.escape(m) for m in mots) + "))") if mots else None
+
+    @classmethod
+    def depuis_fichier(cls, chemin=FICHIER_REGLES):
+        with open(chemin, encoding="utf-8") as f:
+            config = json.load(f)
+        regles = [(r["categorie"], r["mots_cles"]) for r in config["regles"]]
+        return cls(regles, defaut=config.get("defaut", CATEGORIE_PAR_DEFAUT))
+
+    def classer(self, descriptions):
+        # Classe toute une Series de descriptions en un seul passage vectorisé
+        descriptions = pd.Series(descriptions)
+        if self.regex is None:
+            return pd.Series(self.defaut, index=descriptions.index)
+        textes = descriptions.where(descriptions.map(lambda d: isinstance(d, str)), "").str.lower()
+        trouves = textes.str.findall(self.regex)
+        return trouves.map(
+            lambda mots: self.categories[min(self.rang_mot[m] for m in mots)] if mots else self.defaut
+        )
+
+
+def reclasser_produits(db, classifieur):
+    # Réapplique les règles à toute la collection produits après un changement de configuration
+    produits = pd.DataFrame(list(db.produits.find({}, {"nom": 1, "categorie": 1})))
+    if produits.empty:
+        return 0
+    if 'categorie' not in produits:
+        produits['categorie'] = None
+
+    produits['nouvelle_categorie'] = classifieur.classer(produits['nom'])
+    modifies = produits[produits['nouvelle_categorie'] != produits['categorie']]
+
+    client_ids = set()
+    for debut in range(0, len(modifies), TAILLE_LOT):
+        lot = modifies.iloc[debut:debut + TAILLE_LOT]
+        db.produits.bulk_write([
+            UpdateOne({"_id": pid}, {"$set": {"categorie": cat}})
+            for pid, cat in zip(lot['_id'], lot['nouvelle_categorie'])
+        ], ordered=False)
+        # Les lignes de commande dénormalisées suivent la nouvelle catégorie
+        db.commandes.bulk_write([
+            UpdateMany({"produits.produit_id": pid},
+                       {"$set": {"produits.$[ligne].categorie": cat}},
+                       array_filters=[{"ligne.produit_id": pid}])
+            for pid, cat in zip(lot['_id'], lot['nouvelle_categorie'])
+        ], ordered=False)
+        # ... de même que le registre des stocks (stocks_restants, /stocks, alertes)
+        db.stocks.bulk_write([
+            UpdateOne({"_id": pid}, {"$set": {"categorie": cat}})
+            for pid, cat in zip(lot['_id'], lot['nouvelle_categorie'])
+        ], ordered=False)
+        client_ids.update(db.commandes.distinct("client_id", {"produits.produit_id": {"$in": list(lot['_id'])}}))
+
+    # Catégories préférées des clients ayant acheté un produit reclassé (clients_stats)
+    rafraichir_clients(db, [c for c in client_ids if c is not None])
+    if len(modifies):
+        vider_cache()
+    return len(modifies)
+
+
+if __name__ == "__main__":
+    chemin = sys.argv[1] if len(sys.argv) > 1 else FICHIER_REGLES
+    nombre = reclasser_produits(get_db(), ClassifieurCategories.depuis_fichier(chemin))
+    print(f"Produits reclassés : {nombre}")
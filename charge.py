@@ -0,0 +1,280 @@
+# Fichier : charge.py
+# Test de charge de l'API (/ventes, /stocks) et du callback principal du dashboard :
+# rejoue un mélange réaliste de filtres (clients, périodes, produits tirés de la base) à une
+# concurrence donnée, mesure débit, latences p50/p95/p99 et taux d'erreur, et enregistre les
+# résultats pour comparer deux versions.
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from database import get_db, NOM_BASE, BASE_PRODUCTION, MAX_TIME_MS, LISTE
+
+DOSSIER_RESULTATS = "resultats_charge"
+# Poids de chaque requête dans le mélange
+SCENARIOS = {"api_ventes": 4, "api_stocks": 1, "dashboard": 5}
+# Combinaisons de filtres : (client, période, produit) -> poids
+COMBINAISONS = {
+    (False, True, False): 35,
+    (True, True, False): 25,
+    (False, True, True): 20,
+    (True, False, False): 10,
+    (False, False, False): 10,
+}
+# Requêtes dont la réponse ne dépend pas des filtres
+SANS_FILTRES = {"api_stocks"}
+SORTIES_DASHBOARD = [("metrics", "children"), ("ventes-par-categorie", "figure"), ("ventes-par-periode", "figure"),
+                     ("stock-par-produit", "figure"), ("stock-evolution", "figure")]
+
+
+def echantillonner_filtres(nombre, graine):
+    # Les filtres partent de commandes réelles : un client qui a commandé, une période
+    # autour de sa commande, un produit de la commande
+    aleatoire = random.Random(graine)
+    commandes = list(get_db().commandes.aggregate([
+        {"$match": {"date": {"$ne": None}}},
+        {"$sample": {"size": nombre}},
+        {"$project": {"client_id": 1, "date": 1, "produits.produit_id": 1}}
+    ], maxTimeMS=MAX_TIME_MS[LISTE]))
+    if not commandes:
+        sys.exit(f"La base {NOM_BASE} ne contient aucune commande : la générer avec --generer")
+
+    combinaisons = list(COMBINAISONS)
+    poids = list(COMBINAISONS.values())
+    filtres = []
+    for commande in commandes:
+        avec_client, avec_periode, avec_produit = aleatoire.choices(combinaisons, poids)[0]
+        debut = fin = None
+        if avec_periode:
+            duree = aleatoire.choice([7, 31, 92, 365])
+            debut = commande['date'] - timedelta(days=aleatoire.randrange(duree))
+            fin = debut + timedelta(days=duree)
+        filtres.append({
+            "client_id": commande['client_id'] if avec_client else None,
+            "start_date": debut.strftime('%Y-%m-%d') if debut else None,
+            "end_date": fin.strftime('%Y-%m-%d') if fin else None,
+            "produit_id": aleatoire.choice(commande['produits'])['produit_id'] if avec_produit else None,
+        })
+    return filtres
+
+
+def envoyer(url, corps=None, methode="GET", delai=30):
+    donnees = json.dumps(corps).encode() if corps is not None else None
+    requete = urllib.request.Request(url, data=donnees, method=methode,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(requete, timeout=delai) as reponse:
+        contenu = reponse.read()
+        return reponse.status, json.loads(contenu) if contenu else None
+
+
+def appeler_api_ventes(args, filtres, session):
+    # /ventes attend les filtres dans le corps (modèle VentesQuery)
+    envoyer(f"{args.api}/ventes", filtres, delai=args.delai)
+
+
+def appeler_api_stocks(args, filtres, session):
+    envoyer(f"{args.api}/stocks", delai=args.delai)
+
+
+def appeler_dashboard(args, filtres, session):
+    # Reproduit la requête du navigateur vers update_dashboard, puis, comme c'est un callback
+    # en arrière-plan, interroge le serveur jusqu'à ce que la tâche soit terminée
+    valeurs = [("client-filter", "value", filtres["client_id"]),
+               ("date-filter", "start_date", filtres["start_date"]),
+               ("date-filter", "end_date", filtres["end_date"]),
+               ("produit-filter", "value", filtres["produit_id"])]
+    corps = {
+        "output": ".." + "...".join(f"{id_}.{prop}" for id_, prop in SORTIES_DASHBOARD) + "..",
+        "outputs": [{"id": id_, "property": prop} for id_, prop in SORTIES_DASHBOARD],
+        "inputs": [{"id": id_, "property": prop, "value": valeur} for id_, prop, valeur in valeurs],
+        "changedPropIds": ["client-filter.value"],
+        # Identifiant de session de l'utilisateur virtuel (dcc.Store session-id), comme un onglet
+        "state": [{"id": "session-id", "property": "data", "value": session}]
+    }
+    url = f"{args.dashboard}/_dash-update-component"
+    limite = time.monotonic() + args.delai
+    statut, reponse = envoyer(url, corps, methode="POST", delai=args.delai)
+    while reponse is None or "response" not in reponse:
+        if reponse and any("error" in cle for cle in reponse):
+            raise RuntimeError(f"Erreur du callback : {reponse}")
+        if reponse and "cacheKey" in reponse:
+            url = f"{args.dashboard}/_dash-update-component?cacheKey={reponse['cacheKey']}"
+            if reponse.get("job") is not None:
+                url += f"&job={reponse['job']}"
+        if statut == 204:
+            if "?" not in url:
+                return  # Pas de mise à jour (callback synchrone)
+            # Pendant le suivi d'une tâche, 204 signifie qu'elle s'est terminée sans résultat
+            # (tuée, en erreur ou résultat déjà lu) : inutile d'attendre le délai
+            raise RuntimeError("Tâche du dashboard terminée sans résultat (204)")
+        if time.monotonic() > limite:
+            raise TimeoutError("Tâche du dashboard non terminée dans le délai")
+        time.sleep(0.05)
+        statut, reponse = envoyer(url, corps, methode="POST", delai=args.delai)
+
+
+APPELS = {"api_ventes": appeler_api_ventes, "api_stocks": appeler_api_stocks, "dashboard": appeler_dashboard}
+
+
+def percentile(valeurs, p):
+    if not valeurs:
+        return None
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+
+def resumer(mesures, duree):
+    # mesures : (latence, ok, repetition) ; une répétition rejoue des filtres déjà envoyés et
+    # peut être servie par le cache, les latences « à froid » n'en tiennent pas compte
+    latences = [latence for latence, ok, _ in mesures if ok]
+    reussies = len(latences)
+    latences_froid = [latence for latence, ok, repetition in mesures if ok and not repetition]
+    erreurs = sum(1 for _, ok, _ in mesures if not ok)
+    repetitions = sum(1 for _, _, repetition in mesures if repetition)
+    return {
+        "requetes": len(mesures),
+        "erreurs": erreurs,
+        "taux_erreur": erreurs / len(mesures) if mesures else 0,
+        "taux_repetition": repetitions / len(mesures) if mesures else 0,
+        # Débit des seules requêtes réussies : un serveur arrêté (erreurs immédiates) ne doit
+        # pas apparaître comme un gain de débit
+        "debit": reussies / duree,
+        "debit_erreurs": erreurs / duree,
+        "p50": percentile(latences, 50),
+        "p95": percentile(latences, 95),
+        "p99": percentile(latences, 99),
+        "moyenne": sum(latences) / len(latences) if latences else None,
+        "p50_froid": percentile(latences_froid, 50),
+        "p95_froid": percentile(latences_froid, 95),
+    }
+
+
+def lancer(args, filtres):
+    scenarios = [s for s in SCENARIOS if s in args.scenarios]
+    poids = [SCENARIOS[s] for s in scenarios]
+    mesures = {s: [] for s in scenarios}
+    deja_envoyes = set()
+    verrou = threading.Lock()
+    fin = time.monotonic() + args.duree
+
+    def utilisateur(numero):
+        # Boucle fermée : chaque utilisateur virtuel enchaîne les requêtes sans pause
+        aleatoire = random.Random(args.graine + numero)
+        session = str(uuid.uuid4())
+        while time.monotonic() < fin:
+            scenario = aleatoire.choices(scenarios, poids)[0]
+            indice = aleatoire.randrange(len(filtres))
+            cle = (scenario, None if scenario in SANS_FILTRES else indice)
+            with verrou:
+                repetition = cle in deja_envoyes
+                deja_envoyes.add(cle)
+            debut = time.perf_counter()
+            try:
+                APPELS[scenario](args, filtres[indice], session)
+                ok = True
+            except Exception as err:
+                # Toute erreur (HTTP, réseau, réponse inattendue) compte comme une requête en
+                # échec, sans interrompre l'utilisateur virtuel
+                ok = False
+                if args.verbeux:
+                    print(f"{scenario} : {type(err).__name__} : {err}")
+            with verrou:
+                mesures[scenario].append((time.perf_counter() - debut, ok, repetition))
+
+    debut = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrence) as executeur:
+        list(executeur.map(utilisateur, range(args.concurrence)))
+    duree = time.monotonic() - debut
+
+    resultats = {s: resumer(m, duree) for s, m in mesures.items()}
+    resultats["total"] = resumer([mesure for m in mesures.values() for mesure in m], duree)
+    return resultats
+
+
+def formater_ms(valeur):
+    return f"{valeur * 1000:8.1f}" if valeur is not None else "       -"
+
+
+def afficher(resultats, reference=None):
+    print(f"{'scénario':<12} {'requêtes':>9} {'débit/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'erreurs':>8} {'répétées':>9} {'p50 froid':>10} {'p95 froid':>10}")
+    for scenario, r in resultats.items():
+        print(f"{scenario:<12} {r['requetes']:>9} {r['debit']:>8.1f} {formater_ms(r['p50'])} "
+              f"{formater_ms(r['p95'])} {formater_ms(r['p99'])} {r['taux_erreur']:>8.1%} "
+              f"{r['taux_repetition']:>9.1%}   {formater_ms(r['p50_froid'])}   {formater_ms(r['p95_froid'])}")
+        if reference and scenario in reference:
+            ref = reference[scenario]
+            ecarts = []
+            for cle in ("debit", "p50", "p95", "p99", "p50_froid", "p95_froid"):
+                if r[cle] and ref.get(cle):
+                    ecarts.append(f"{cle} {(r[cle] - ref[cle]) / ref[cle]:+.0%}")
+            print(f"{'':<12} vs référence : {', '.join(ecarts)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'API et du dashboard e-commerce")
+    parser.add_argument("--api", default="http://localhost:8000")
+    parser.add_argument("--dashboard", default="http://localhost:8050")
+    parser.add_argument("--concurrence", type=int, default=10, help="Nombre d'utilisateurs virtuels simultanés")
+    parser.add_argument("--duree", type=int, default=60, help="Durée du test en secondes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Requêtes à rejouer parmi {', '.join(SCENARIOS)}")
+    parser.add_argument("--filtres", type=int, default=500, help="Nombre de jeux de filtres tirés de la base")
+    parser.add_argument("--delai", type=float, default=30, help="Délai maximal d'une requête (s)")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--etiquette", default="local", help="Nom de la version testée (fichier de résultats)")
+    parser.add_argument("--comparer", help="Fichier de résultats d'une précédente exécution")
+    parser.add_argument("--generer", type=int, metavar="NB_COMMANDES",
+                        help="Génère d'abord une base synthétique (ECOMMERCE_DB) de cette taille")
+    parser.add_argument("--vider-cache", action="store_true",
+                        help="Vide le cache de données partagé (même ECOMMERCE_CACHE_DIR que les serveurs) avant le test")
+    parser.add_argument("--verbeux", action="store_true")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",")]
+
+    if args.generer:
+        if NOM_BASE == BASE_PRODUCTION:
+            sys.exit("--generer remplace la base : définir ECOMMERCE_DB sur une base dédiée (ex. ecommerce_charge)")
+        from jeu_de_donnees import generer
+        print(f"Base {NOM_BASE} générée :", generer(get_db(), nb_commandes=args.generer))
+
+    if args.vider_cache:
+        from cache import vider_cache, CACHE_DIR
+        vider_cache()
+        print(f"Cache {CACHE_DIR} vidé")
+
+    filtres = echantillonner_filtres(args.filtres, args.graine)
+    print(f"{args.concurrence} utilisateurs pendant {args.duree} s ({len(filtres)} jeux de filtres)...")
+    resultats = lancer(args, filtres)
+
+    reference = None
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            reference = json.load(f)["resultats"]
+    afficher(resultats, reference)
+
+    os.makedirs(DOSSIER_RESULTATS, exist_ok=True)
+    horodatage = datetime.now().strftime('%Y%m%d_%H%M%S')
+    chemin = os.path.join(DOSSIER_RESULTATS, f"{args.etiquette}_{horodatage}.json")
+    with open(chemin, "w", encoding="utf-8") as f:
+        json.dump({
+            "etiquette": args.etiquette,
+            "date": horodatage,
+            "base": NOM_BASE,
+            "configuration": {cle: getattr(args, cle) for cle in
+                              ("api", "dashboard", "concurrence", "duree", "scenarios", "filtres", "graine",
+                               "vider_cache")},
+            "resultats": resultats
+        }, f, indent=2, ensure_ascii=False)
+    print(f"Résultats enregistrés dans {chemin}")
+
+
+if __name__ == '__main__':
+    main()
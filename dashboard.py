@@ -1,41 +1,57 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, DiskcacheManager
 import plotly.express as px
 import pandas as pd
 import pymongo
 from datetime import datetime
 import sys
+import uuid
 from dateutil.relativedelta import relativedelta
+from cache import cache, callback_cache, CACHE_EXPIRE
+from database import get_client, get_db, ANALYTIQUE, LISTE, PONCTUELLE, MAX_TIME_MS
+from stocks import stocks_a_date, mouvements_periode, SEUIL_STOCK_FAIBLE
+from analytique_clients import SEGMENTS
 
 # Connexion à MongoDB avec gestion des erreurs
 try:
-    client = pymongo.MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=5000)
-    client.server_info()
-    db = client["ecommerce"]
+    get_client().server_info()
 except pymongo.errors.ServerSelectionTimeoutError as err:
     print(
         f"Erreur : Impossible de se connecter à MongoDB. Assurez-vous que 'mongod' est en cours d'exécution. Détails : {err}")
     sys.exit(1)
 
 # Charger les données pour les dropdowns avec validation et nettoyage
-clients = list(db.clients.find())
-client_options = [
-    {'label': str(c['nom']).strip(), 'value': int(c['_id'])}
-    for c in clients if 'nom' in c and '_id' in c and c['nom'] and c['_id'] is not None
-]
-
-produits = list(db.produits.find())
-produit_options = [
-    {'label': str(p['nom']).strip().replace('\n', '').replace('\r', ''), 'value': str(p['_id']).strip()}
-    for p in produits if 'nom' in p and '_id' in p and p['nom'] and p['_id'] is not None
-]
+# (mis en cache : seul le premier worker interroge MongoDB au démarrage)
+@cache.memoize(name='dashboard.catalogue', expire=CACHE_EXPIRE)
+def charger_catalogue():
+    db = get_db()
+    clients = list(db.clients.find(max_time_ms=MAX_TIME_MS[LISTE]))
+    client_options = [
+        {'label': str(c['nom']).strip(), 'value': int(c['_id'])}
+        for c in clients if 'nom' in c and '_id' in c and c['nom'] and c['_id'] is not None
+    ]
+
+    produits = list(db.produits.find(max_time_ms=MAX_TIME_MS[LISTE]))
+    produit_options = [
+        {'label': str(p['nom']).strip().replace('\n', '').replace('\r', ''), 'value': str(p['_id']).strip()}
+        for p in produits if 'nom' in p and '_id' in p and p['nom'] and p['_id'] is not None
+    ]
+    return client_options, produit_options
+
+
+client_options, produit_options = charger_catalogue()
 
 # Debugging
 print("Client options:", client_options)
 print("Produit options:", produit_options)
 
+# Les callbacks lourds s'exécutent en arrière-plan, hors du thread de requête :
+# une requête longue ne bloque plus les callbacks des autres utilisateurs
+background_callback_manager = DiskcacheManager(callback_cache)
+
 # Initialisation de l'application Dash
-app = dash.Dash(__name__)
+app = dash.Dash(__name__, background_callback_manager=background_callback_manager)
+server = app.server  # Application WSGI servie par gunicorn (voir serve.py)
 
 # Styles CSS pour un design clair, précis et moderne
 app.css.append_css({
@@ -43,7 +59,7 @@ app.css.append_css({
 })
 
 # Mise en page avec style
-app.layout = html.Div([
+contenu = html.Div([
     # En-tête
     html.Div([
         html.H1("Dashboard E-commerce", style={
@@ -59,7 +75,20 @@ app.layout = html.Div([
 
     # Filtres
     html.Div([
-        html.Label("Client :", style={'fontWeight': 'bold', 'marginRight': '10px'}),
+        html.Label("Segment :", style={'fontWeight': 'bold', 'marginRight': '10px'}),
+        dcc.Dropdown(
+            id='segment-filter',
+            options=[{'label': s, 'value': s} for s in SEGMENTS],
+            value=None,
+            placeholder="Tous les segments",
+            style={
+                'width': '160px',
+                'borderRadius': '5px',
+                'border': '1px solid #ccc',
+                'padding': '5px'
+            }
+        ),
+        html.Label("Client :", style={'fontWeight': 'bold', 'marginRight': '10px', 'marginLeft': '20px'}),
         dcc.Dropdown(
             id='client-filter',
             options=client_options,
@@ -118,6 +147,12 @@ app.layout = html.Div([
         'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'
     }),
 
+    # Progression du calcul en arrière-plan
+    html.Progress(id='progression', value='0', max='3', style={
+        'width': '100%',
+        'visibility': 'hidden'
+    }),
+
     # Métriques
     html.Div(id='metrics', style={
         'display': 'flex',
@@ -129,6 +164,9 @@ app.layout = html.Div([
         'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'
     }),
 
+    # Fiche du client sélectionné (statistiques précalculées)
+    html.Div(id='client-stats', style={'margin': '0 0 20px 0'}),
+
     # Graphiques
     html.Div([
         dcc.Graph(id='ventes-par-categorie', style={'marginBottom': '20px'}),
@@ -150,81 +188,95 @@ app.layout = html.Div([
 })
 
 
-# Callback pour mettre à jour le dashboard
-@app.callback(
-    [Output('metrics', 'children'),
-     Output('ventes-par-categorie', 'figure'),
-     Output('ventes-par-periode', 'figure'),
-     Output('stock-par-produit', 'figure'),
-     Output('stock-evolution', 'figure')],
-    [Input('client-filter', 'value'),
-     Input('date-filter', 'start_date'),
-     Input('date-filter', 'end_date'),
-     Input('produit-filter', 'value')]
-)
-def update_dashboard(client_id, start_date, end_date, produit_id):
+# La mise en page est recalculée à chaque chargement de page : chaque session reçoit un
+# identifiant propre. Passé en State aux callbacks en arrière-plan, il entre dans la clé
+# de leurs tâches : deux utilisateurs aux filtres identiques ne partagent plus une tâche,
+# dont le résultat est supprimé du gestionnaire à la première lecture.
+def layout():
+    return html.Div([dcc.Store(id='session-id', data=str(uuid.uuid4())), contenu])
+
+
+app.layout = layout
+
+
+def bornes_periode(start_date, end_date):
+    if start_date and end_date:
+        return datetime.fromisoformat(start_date), datetime.fromisoformat(end_date)
+    return datetime(2010, 1, 1), datetime(2011, 12, 31)
+
+
+# Résultats mis en cache : les commandes filtrées sont partagées entre le dashboard et l'export CSV
+@cache.memoize(name='dashboard.commandes', expire=CACHE_EXPIRE)
+def charger_commandes(client_id, start_date, end_date, produit_id):
     query = {}
     if client_id is not None:
         query['client_id'] = client_id
     if start_date and end_date:
-        start_dt = datetime.fromisoformat(start_date)
-        end_dt = datetime.fromisoformat(end_date)
+        start_dt, end_dt = bornes_periode(start_date, end_date)
         query['date'] = {
             '$gte': start_dt,
             '$lte': end_dt
         }
-    else:
-        start_dt = datetime(2010, 1, 1)
-        end_dt = datetime(2011, 12, 31)
 
-    # Étape 1 : Récupérer les commandes correspondant aux filtres de client et de date
-    commandes = list(db.commandes.find(query))
+    if produit_id:
+        query['produits.produit_id'] = produit_id
 
-    # Étape 2 : Filtrer les commandes par produit (si un produit est sélectionné)
+    # Étape 1 : Récupérer les commandes correspondant aux filtres de client, de date et de produit
+    commandes = list(get_db(ANALYTIQUE).commandes.find(query, max_time_ms=MAX_TIME_MS[ANALYTIQUE]))
+
+    # Étape 2 : Ne garder que la ligne du produit sélectionné (au prix facturé)
     if produit_id:
         filtered_commandes = []
         for commande in commandes:
             for produit in commande['produits']:
                 if produit['produit_id'] == produit_id:
-                    prod = db.produits.find_one({'_id': produit_id})
-                    if prod:
-                        montant_produit = prod['prix'] * produit['quantite']
-                        commande_copy = commande.copy()
-                        commande_copy['montant_total'] = montant_produit
-                        commande_copy['produits'] = [produit]
-                        filtered_commandes.append(commande_copy)
+                    commande_copy = commande.copy()
+                    commande_copy['montant_total'] = produit['prix_unitaire'] * produit['quantite']
+                    commande_copy['produits'] = [produit]
+                    filtered_commandes.append(commande_copy)
                     break
         commandes = filtered_commandes
-    else:
-        filtered_commandes = commandes
 
-    # Étape 3 : Calculer les métriques basées sur les commandes filtrées
-    total_revenus = sum(c['montant_total'] for c in filtered_commandes)
-    nombre_commandes = len(filtered_commandes)
-    panier_moyen = total_revenus / nombre_commandes if nombre_commandes else 0
+    return commandes
 
-    # Étape 4 : Calculer le stock restant pour chaque produit
-    produits = list(db.produits.find({} if not produit_id else {'_id': produit_id}))
-    quantites_vendues = {}
-    for commande in commandes:
-        for produit in commande['produits']:
-            prod_id = produit['produit_id']
-            quantite = produit['quantite']
-            quantites_vendues[prod_id] = quantites_vendues.get(prod_id, 0) + quantite
 
-    # Calculer le stock restant et préparer les données pour le graphique
+# Stocks lus dans le registre (stocks.py) : le stock est une propriété du produit,
+# il ne dépend donc que de la période et du produit sélectionnés
+@cache.memoize(name='dashboard.stocks', expire=CACHE_EXPIRE)
+def calculer_stocks(start_date, end_date, produit_id):
+    start_dt, end_dt = bornes_periode(start_date, end_date)
+
+    # Étape 4 : Stock restant de chaque produit à la fin de la période
     stock_data = []
-    for p in produits:
-        prod_id = p['_id']
-        stock_initial = p['stock']
-        quantite_vendue = quantites_vendues.get(prod_id, 0)
-        stock_restant = max(0, stock_initial - quantite_vendue)
+    for nom, stock in stocks_a_date(get_db(ANALYTIQUE), end_dt, produit_id or None).values():
+        stock_restant = max(0, stock)
         stock_data.append({
-            'Produit': p['nom'],
+            'Produit': nom,
             'Stock Restant': stock_restant,
-            'Stock Faible': stock_restant < 10  # Indiquer si le stock est faible (< 10 unités)
+            'Stock Faible': stock_restant < SEUIL_STOCK_FAIBLE  # Indiquer si le stock est faible
         })
 
+    # Soldes successifs du registre sur la période, pour l'évolution du stock
+    stock_evolution_data = [
+        {'Produit': m['nom'], 'Date': m['date'], 'Stock Restant': max(0, m['solde'])}
+        for m in mouvements_periode(get_db(ANALYTIQUE), start_dt, end_dt, produit_id or None)
+    ]
+
+    return stock_data, stock_evolution_data
+
+
+# Figures mises en cache : un même jeu de filtres n'est calculé qu'une fois pour tous les workers
+@cache.memoize(name='dashboard.figures', expire=CACHE_EXPIRE)
+def construire_figures(client_id, start_date, end_date, produit_id):
+    start_dt, end_dt = bornes_periode(start_date, end_date)
+    commandes = charger_commandes(client_id, start_date, end_date, produit_id)
+    stock_data, stock_evolution_data = calculer_stocks(start_date, end_date, produit_id)
+
+    # Étape 3 : Calculer les métriques basées sur les commandes filtrées
+    total_revenus = sum(c['montant_total'] for c in commandes)
+    nombre_commandes = len(commandes)
+    panier_moyen = total_revenus / nombre_commandes if nombre_commandes else 0
+
     # Calculer le stock restant total pour la métrique
     stock_restant_total = sum(item['Stock Restant'] for item in stock_data)
 
@@ -250,13 +302,10 @@ def update_dashboard(client_id, start_date, end_date, produit_id):
 
     # Ventes par catégorie
     categorie_data = {}
-    for commande in filtered_commandes:
+    for commande in commandes:
         for produit in commande['produits']:
-            prod = db.produits.find_one({'_id': produit['produit_id']})
-            if not prod:
-                continue
-            cat = prod['categorie']
-            montant = prod['prix'] * produit['quantite']
+            cat = produit['categorie']
+            montant = produit['prix_unitaire'] * produit['quantite']
             categorie_data[cat] = categorie_data.get(cat, 0) + montant
     df_categorie = pd.DataFrame(list(categorie_data.items()), columns=['Categorie', 'Ventes'])
     fig_categorie = px.pie(df_categorie, names='Categorie', values='Ventes', title='Ventes par catégorie',
@@ -268,7 +317,7 @@ def update_dashboard(client_id, start_date, end_date, produit_id):
     date_format = '%Y-%m-%d' if delta.days <= 31 else '%Y-%m'
     df_periode = pd.DataFrame([
         {'Date': c['date'].strftime(date_format), 'Montant': c['montant_total']}
-        for c in filtered_commandes
+        for c in commandes
     ])
     if not df_periode.empty:
         df_periode = df_periode.groupby('Date').sum().reset_index()
@@ -300,28 +349,9 @@ def update_dashboard(client_id, start_date, end_date, produit_id):
         fig_stock = px.bar(title='Stock restant par produit')
 
     # Évolution du stock restant au fil du temps
-    stock_evolution_data = []
-    for p in produits:
-        prod_id = p['_id']
-        stock_initial = p['stock']
-        stock_actuel = stock_initial
-        # Parcourir les commandes triées par date pour calculer l'évolution
-        commandes_sorted = sorted(commandes, key=lambda x: x['date'])
-        for commande in commandes_sorted:
-            date = commande['date'].strftime(date_format)
-            for produit in commande['produits']:
-                if produit['produit_id'] == prod_id:
-                    quantite = produit['quantite']
-                    stock_actuel = max(0, stock_actuel - quantite)
-                    stock_evolution_data.append({
-                        'Produit': p['nom'],
-                        'Date': date,
-                        'Stock Restant': stock_actuel
-                    })
-
     df_stock_evolution = pd.DataFrame(stock_evolution_data)
     if not df_stock_evolution.empty:
-        df_stock_evolution = df_stock_evolution.sort_values('Date')
+        df_stock_evolution['Date'] = df_stock_evolution['Date'].dt.strftime(date_format)
         fig_stock_evolution = px.line(df_stock_evolution, x='Date', y='Stock Restant', color='Produit',
                                       title='Évolution du stock restant au fil du temps',
                                       line_shape='linear', render_mode='svg')
@@ -332,63 +362,132 @@ def update_dashboard(client_id, start_date, end_date, produit_id):
     return metrics, fig_categorie, fig_periode, fig_stock, fig_stock_evolution
 
 
-# Callback pour l'export CSV
-@app.callback(
-    Output("download-dataframe-csv", "data"),
-    Input("export-button", "n_clicks"),
-    State('client-filter', 'value'),
-    State('date-filter', 'start_date'),
-    State('date-filter', 'end_date'),
-    State('produit-filter', 'value'),
-    prevent_initial_call=True,
-)
-def export_to_csv(n_clicks, client_id, start_date, end_date, produit_id):
-    query = {}
-    if client_id is not None:
-        query['client_id'] = client_id
-    if start_date and end_date:
-        query['date'] = {
-            '$gte': datetime.fromisoformat(start_date),
-            '$lte': datetime.fromisoformat(end_date)
-        }
-
-    commandes = list(db.commandes.find(query))
-    if produit_id:
-        filtered_commandes = []
-        for commande in commandes:
-            for produit in commande['produits']:
-                if produit['produit_id'] == produit_id:
-                    prod = db.produits.find_one({'_id': produit_id})
-                    if prod:
-                        montant_produit = prod['prix'] * produit['quantite']
-                        commande_copy = commande.copy()
-                        commande_copy['montant_total'] = montant_produit
-                        commande_copy['produits'] = [produit]
-                        filtered_commandes.append(commande_copy)
-                    break
-        commandes = filtered_commandes
+@cache.memoize(name='dashboard.export', expire=CACHE_EXPIRE)
+def exporter_commandes(client_id, start_date, end_date, produit_id):
+    commandes = charger_commandes(client_id, start_date, end_date, produit_id)
 
     export_data = []
     for commande in commandes:
         for produit in commande['produits']:
-            prod = db.produits.find_one({'_id': produit['produit_id']})
-            if not prod:
-                continue
             export_data.append({
                 "CommandeID": commande['_id'],
                 "ClientID": commande['client_id'],
-                "Produit": prod['nom'],
-                "Categorie": prod['categorie'],
+                "Produit": produit['nom'],
+                "Categorie": produit['categorie'],
                 "Quantite": produit['quantite'],
-                "PrixUnitaire": prod['prix'],
-                "Montant": prod['prix'] * produit['quantite'],
+                "PrixUnitaire": produit['prix_unitaire'],
+                "Montant": produit['prix_unitaire'] * produit['quantite'],
                 "Date": commande['date'].strftime('%Y-%m-%d')
             })
+    return export_data
+
+
+# Callback pour mettre à jour le dashboard
+@app.callback(
+    [Output('metrics', 'children'),
+     Output('ventes-par-categorie', 'figure'),
+     Output('ventes-par-periode', 'figure'),
+     Output('stock-par-produit', 'figure'),
+     Output('stock-evolution', 'figure')],
+    [Input('client-filter', 'value'),
+     Input('date-filter', 'start_date'),
+     Input('date-filter', 'end_date'),
+     Input('produit-filter', 'value')],
+    State('session-id', 'data'),
+    background=True,
+    progress=[Output('progression', 'value'), Output('progression', 'max')],
+    running=[(Output('progression', 'style'),
+              {'width': '100%', 'visibility': 'visible'},
+              {'width': '100%', 'visibility': 'hidden'})],
+)
+def update_dashboard(set_progress, client_id, start_date, end_date, produit_id, session_id):
+    # Si les filtres changent pendant le calcul, Dash termine la tâche devenue obsolète
+    # avant de lancer la nouvelle ; chaque étape est en cache, une tâche relancée
+    # reprend donc là où la précédente s'était arrêtée.
+    set_progress(('0', '3'))
+    charger_commandes(client_id, start_date, end_date, produit_id)
+    set_progress(('1', '3'))
+    calculer_stocks(start_date, end_date, produit_id)
+    set_progress(('2', '3'))
+    resultat = construire_figures(client_id, start_date, end_date, produit_id)
+    set_progress(('3', '3'))
+    return resultat
+
+
+# Callback pour restreindre la liste des clients au segment RFM choisi (lecture indexée de clients_stats)
+@app.callback(
+    Output('client-filter', 'options'),
+    Input('segment-filter', 'value')
+)
+def update_client_options(segment):
+    if segment is None:
+        return client_options
+    client_ids = {s['_id'] for s in get_db().clients_stats.find({'segment': segment}, {'_id': 1},
+                                                                 max_time_ms=MAX_TIME_MS[LISTE])}
+    return [option for option in client_options if option['value'] in client_ids]
+
+
+# Callback pour la fiche du client sélectionné : une seule lecture de clients_stats
+@app.callback(
+    Output('client-stats', 'children'),
+    Input('client-filter', 'value')
+)
+def update_client_stats(client_id):
+    if client_id is None:
+        return None
+    stats = get_db().clients_stats.find_one({'_id': client_id}, max_time_ms=MAX_TIME_MS[PONCTUELLE])
+    if not stats:
+        return html.P("Aucune commande pour ce client.")
+
+    indicateurs = [
+        ("Segment", f"{stats['segment']} (RFM {stats['rfm']})"),
+        ("Récence", f"{stats['recence']} jours"),
+        ("Commandes", f"{stats['frequence']}"),
+        ("Montant total", f"{stats['montant']:.2f} €"),
+        ("Première commande", stats['premiere_commande'].strftime('%Y-%m-%d')),
+        ("Dernière commande", stats['derniere_commande'].strftime('%Y-%m-%d')),
+        ("Catégories préférées", ", ".join(stats.get('top_categories', [])))
+    ]
+    return html.Div([
+        html.Div([
+            html.H4(titre, style={'color': '#2c3e50', 'margin': '0'}),
+            html.P(valeur, style={'fontSize': '18px', 'color': '#3498db'})
+        ], style={'textAlign': 'center'})
+        for titre, valeur in indicateurs
+    ], style={
+        'display': 'flex',
+        'justifyContent': 'space-around',
+        'padding': '10px',
+        'backgroundColor': '#ffffff',
+        'borderRadius': '10px',
+        'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'
+    })
+
 
-    df_export = pd.DataFrame(export_data)
+# Callback pour l'export CSV
+@app.callback(
+    Output("download-dataframe-csv", "data"),
+    Input("export-button", "n_clicks"),
+    State('client-filter', 'value'),
+    State('date-filter', 'start_date'),
+    State('date-filter', 'end_date'),
+    State('produit-filter', 'value'),
+    State('session-id', 'data'),
+    prevent_initial_call=True,
+    background=True,
+    running=[(Output('export-button', 'disabled'), True, False)],
+    # Un export lancé avec d'anciens filtres est abandonné dès qu'ils changent
+    cancel=[Input('client-filter', 'value'),
+            Input('date-filter', 'start_date'),
+            Input('date-filter', 'end_date'),
+            Input('produit-filter', 'value')],
+)
+def export_to_csv(n_clicks, client_id, start_date, end_date, produit_id, session_id):
+    df_export = pd.DataFrame(exporter_commandes(client_id, start_date, end_date, produit_id))
     return dcc.send_data_frame(df_export.to_csv, "ventes_export.csv")
 
 
-# Lancer l'application
+# Lancer l'application (serveur de développement, un seul processus ;
+# en production utiliser serve.py)
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,76 @@
+# Fichier : database.py
+# Accès partagé à MongoDB : clients construits depuis la configuration (variables
+# d'environnement), limites de durée par classe de requête et routage des lectures
+# analytiques lourdes vers les secondaires.
+import os
+
+import pymongo
+from pymongo import ReadPreference
+
+MONGO_URI = os.environ.get("ECOMMERCE_MONGO_URI", "mongodb://localhost:27017/")
+BASE_PRODUCTION = "ecommerce"
+NOM_BASE = os.environ.get("ECOMMERCE_DB", BASE_PRODUCTION)
+
+# Pool de connexions, compression et délais (millisecondes)
+TAILLE_POOL_MAX = int(os.environ.get("ECOMMERCE_MONGO_POOL_MAX", 50))
+TAILLE_POOL_MIN = int(os.environ.get("ECOMMERCE_MONGO_POOL_MIN", 0))
+# zstd et snappy nécessitent pymongo[zstd,snappy] ; pymongo ignore ceux qui ne sont pas installés
+COMPRESSEURS = os.environ.get("ECOMMERCE_MONGO_COMPRESSEURS", "zstd,snappy,zlib")
+DELAI_SELECTION_MS = int(os.environ.get("ECOMMERCE_MONGO_DELAI_SELECTION_MS", 5000))
+DELAI_CONNEXION_MS = int(os.environ.get("ECOMMERCE_MONGO_DELAI_CONNEXION_MS", 5000))
+DELAI_SOCKET_MS = int(os.environ.get("ECOMMERCE_MONGO_DELAI_SOCKET_MS", 60000))
+
+# Classes de requêtes et durée maximale côté serveur (maxTimeMS) de chacune
+PONCTUELLE = "ponctuelle"    # lecture d'un document ou d'un petit résultat sur index
+LISTE = "liste"              # catalogue, classements
+ANALYTIQUE = "analytique"    # agrégations et parcours de l'historique des ventes
+MAX_TIME_MS = {
+    PONCTUELLE: int(os.environ.get("ECOMMERCE_MAXTIME_PONCTUELLE_MS", 1000)),
+    LISTE: int(os.environ.get("ECOMMERCE_MAXTIME_LISTE_MS", 5000)),
+    ANALYTIQUE: int(os.environ.get("ECOMMERCE_MAXTIME_ANALYTIQUE_MS", 30000)),
+}
+
+# Les lectures analytiques partent sur un secondaire quand il y en a un, pour ne pas
+# concurrencer l'ingestion sur le primaire ; les autres lectures restent sur le primaire
+PREFERENCES_LECTURE = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+PREFERENCE_ANALYTIQUE = PREFERENCES_LECTURE[os.environ.get("ECOMMERCE_LECTURE_ANALYTIQUE", "secondaryPreferred")]
+
+# Un client par processus : un MongoClient ne doit pas être réutilisé après un fork
+# (workers gunicorn, tâches des callbacks Dash en arrière-plan)
+_clients = {}
+
+
+def get_client():
+    pid = os.getpid()
+    if pid not in _clients:
+        _clients[pid] = pymongo.MongoClient(
+            MONGO_URI,
+            maxPoolSize=TAILLE_POOL_MAX,
+            minPoolSize=TAILLE_POOL_MIN,
+            compressors=COMPRESSEURS,
+            serverSelectionTimeoutMS=DELAI_SELECTION_MS,
+            connectTimeoutMS=DELAI_CONNEXION_MS,
+            socketTimeoutMS=DELAI_SOCKET_MS,
+            appname="ecommerce"
+        )
+    return _clients[pid]
+
+
+def fermer_client():
+    # Ferme le client du processus courant ; le prochain get_client() en recrée un
+    client = _clients.pop(os.getpid(), None)
+    if client is not None:
+        client.close()
+
+
+def get_db(classe=None):
+    db = get_client()[NOM_BASE]
+    if classe == ANALYTIQUE:
+        return db.with_options(read_preference=PREFERENCE_ANALYTIQUE)
+    return db
@@ -1,13 +1,17 @@
 # Fichier : import_ecommerce_data.py
 import pandas as pd
-import pymongo
+from database import get_db
 from datetime import datetime
 import random
+from cache import vider_cache
+from stocks import reconstruire_registre
+from analytique_clients import calculer_clients_stats
+from index_mongodb import creer_index
+from categories import ClassifieurCategories
 
 # Connexion à MongoDB
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["ecommerce"]
-client.drop_database("ecommerce")  # Réinitialiser la base
+db = get_db()
+db.client.drop_database(db.name)  # Réinitialiser la base
 
 # Charger le dataset CSV
 df = pd.read_csv("ecommerce_data.csv", encoding= "ISO-8859-1")#, nrows=10000
@@ -16,31 +20,22 @@ df = pd.read_csv("ecommerce_data.csv", encoding= "ISO-8859-1")#, nrows=10000
 # Extraire les produits uniques (StockCode, Description, UnitPrice)
 produits_df = df[['StockCode', 'Description', 'UnitPrice']].drop_duplicates(subset=['StockCode'])
 
-# Ajouter un champ catégorie (déduit à partir de la description)
-def deduce_category(description):
-    if not isinstance(description, str):
-        return "Divers"  # Ou ce que tu veux par défaut
-    description = description.lower()
-    if any(word in description for word in ['light', 'lantern', 'holder', 'lamp']):
-        return "Maison"
-    elif any(word in description for word in ['doll', 'playhouse', 'block', 'babushka', 'bird']):
-        return "Jouets"
-    elif any(word in description for word in ['warmer', 'cosy', 'teaspoons']):
-        return "Cuisine"
-    else:
-        return "Divers"
+# Ajouter un champ catégorie (déduit à partir de la description, règles dans categories.json)
+classifieur = ClassifieurCategories.depuis_fichier()
+produits_df['categorie'] = classifieur.classer(produits_df['Description'])
 
 produits = []
 for idx, row in produits_df.iterrows():
     produit = {
         "_id": str(row['StockCode']),  # Utiliser StockCode comme identifiant
         "nom": row['Description'],
-        "categorie": deduce_category(row['Description']),
+        "categorie": row['categorie'],
         "prix": float(row['UnitPrice']),
         "stock": random.randint(50, 500)  # Simuler un stock
     }
     produits.append(produit)
 db.produits.insert_many(produits)
+produits_par_id = {p['_id']: p for p in produits}
 
 # Étape 2 : Créer la collection Clients
 # Extraire les clients uniques (CustomerID)
@@ -65,9 +60,16 @@ for invoice_no, group in commandes_group:
     # Ignorer si pas de CustomerID
     if pd.isna(group['CustomerID'].iloc[0]):
         continue
-    # Liste des produits dans cette commande
+    # Liste des produits dans cette commande, dénormalisée : chaque ligne garde le prix
+    # réellement facturé ainsi que le nom et la catégorie du produit
     produits_commandes = [
-        {"produit_id": row['StockCode'], "quantite": int(row['Quantity'])}
+        {
+            "produit_id": row['StockCode'],
+            "quantite": int(row['Quantity']),
+            "prix_unitaire": float(row['UnitPrice']),
+            "nom": produits_par_id[str(row['StockCode'])]['nom'],
+            "categorie": produits_par_id[str(row['StockCode'])]['categorie']
+        }
         for idx, row in group.iterrows()
     ]
     # Calculer le montant total
@@ -91,5 +93,9 @@ for invoice_no, group in commandes_group:
     }
     commandes.append(commande)
 db.commandes.insert_many(commandes)
+creer_index(db)
+reconstruire_registre(db)  # Registre des stocks : mouvements et soldes par produit
+calculer_clients_stats(db)  # Statistiques et segments RFM par client
+vider_cache()  # Les résultats en cache portent sur l'ancienne base
 
 print("Dataset importé avec succès dans MongoDB.")
\ No newline at end of file
@@ -0,0 +1,19 @@
+# Fichier : index_mongodb.py
+# Index utilisés par les requêtes du dashboard, de l'API et des agrégations
+from pymongo import ASCENDING
+from database import get_db
+from stocks import creer_index_stocks
+from analytique_clients import creer_index_clients
+
+
+def creer_index(db):
+    db.commandes.create_index([("date", ASCENDING)])
+    db.commandes.create_index([("client_id", ASCENDING), ("date", ASCENDING)])
+    db.commandes.create_index([("produits.produit_id", ASCENDING), ("date", ASCENDING)])
+    creer_index_stocks(db)
+    creer_index_clients(db)
+
+
+if __name__ == "__main__":
+    creer_index(get_db())
+    print("Index créés.")
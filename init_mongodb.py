@@ -1,11 +1,14 @@
-import pymongo
+from database import get_db
 from datetime import datetime
 import random
+from cache import vider_cache
+from stocks import reconstruire_registre
+from analytique_clients import calculer_clients_stats
+from index_mongodb import creer_index
 
 # Connexion à MongoDB
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["ecommerce"]
-client.drop_database("ecommerce")  # Réinitialiser la base pour repartir de zéro
+db = get_db()
+db.client.drop_database(db.name)  # Réinitialiser la base pour repartir de zéro
 
 # Collection Produits
 produits = [
@@ -29,13 +32,11 @@ commandes = []
 for i in range(20):
     client_id = random.choice([1, 2, 3])
     produits_commandes = random.sample(
-        [{"produit_id": p["_id"], "quantite": random.randint(1, 5)} for p in produits],
+        [{"produit_id": p["_id"], "quantite": random.randint(1, 5), "prix_unitaire": p["prix"],
+          "nom": p["nom"], "categorie": p["categorie"]} for p in produits],
         k=random.randint(1, 3)
     )
-    montant_total = sum(
-        db.produits.find_one({"_id": p["produit_id"]})["prix"] * p["quantite"]
-        for p in produits_commandes
-    )
+    montant_total = sum(p["prix_unitaire"] * p["quantite"] for p in produits_commandes)
     commande = {
         "_id": i + 1,
         "client_id": client_id,
@@ -45,5 +46,9 @@ for i in range(20):
     }
     commandes.append(commande)
 db.commandes.insert_many(commandes)
+creer_index(db)
+reconstruire_registre(db)  # Registre des stocks : mouvements et soldes par produit
+calculer_clients_stats(db)  # Statistiques et segments RFM par client
+vider_cache()  # Les résultats en cache portent sur l'ancienne base
 
 print("Base MongoDB initialisée avec succès.")
\ No newline at end of file
@@ -0,0 +1,79 @@
+# Fichier : jeu_de_donnees.py
+# Génère une base synthétique reproductible, au même format que import_ecommerce_data.py,
+# pour les tests de performance et les tests de charge.
+import random
+import sys
+from datetime import datetime, timedelta
+
+from database import get_client, BASE_PRODUCTION
+from categories import ClassifieurCategories
+from index_mongodb import creer_index
+from stocks import reconstruire_registre
+from analytique_clients import calculer_clients_stats
+
+ADJECTIFS = ["RED", "WHITE", "VINTAGE", "HEART", "REGENCY", "PINK", "BLUE", "JUMBO", "RETROSPOT", "GLASS"]
+OBJETS = ["LANTERN", "T-LIGHT HOLDER", "LAMP", "DOLL", "PLAYHOUSE", "BIRD ORNAMENT", "BABUSHKA",
+          "TEA COSY", "HAND WARMER", "TEASPOONS", "MUG", "BAG", "GREETING CARD", "CLOCK", "CANDLE"]
+DEBUT = datetime(2010, 12, 1)
+FIN = datetime(2011, 12, 9)
+
+
+def generer(db, nb_produits=500, nb_clients=1000, nb_commandes=10000, graine=42):
+    # La base est supprimée puis recréée : jamais sur la base de production
+    if db.name == BASE_PRODUCTION:
+        raise ValueError(f"Refus de régénérer la base {BASE_PRODUCTION} : utiliser une base dédiée")
+    aleatoire = random.Random(graine)
+    db.client.drop_database(db.name)
+
+    noms = [f"{aleatoire.choice(ADJECTIFS)} {aleatoire.choice(OBJETS)} {i:04d}" for i in range(nb_produits)]
+    categories = ClassifieurCategories.depuis_fichier().classer(noms)
+    produits = [
+        {
+            "_id": f"{20000 + i}",
+            "nom": nom,
+            "categorie": categorie,
+            "prix": round(aleatoire.uniform(0.5, 50), 2),
+            "stock": aleatoire.randint(50, 500)
+        }
+        for i, (nom, categorie) in enumerate(zip(noms, categories))
+    ]
+    db.produits.insert_many(produits)
+
+    clients = [
+        {"_id": 12000 + i, "nom": f"Client_{12000 + i}", "email": f"client_{12000 + i}@example.com"}
+        for i in range(nb_clients)
+    ]
+    db.clients.insert_many(clients)
+
+    secondes = int((FIN - DEBUT).total_seconds())
+    commandes = []
+    for i in range(nb_commandes):
+        lignes = [
+            {
+                "produit_id": p["_id"],
+                "quantite": aleatoire.randint(1, 12),
+                "prix_unitaire": p["prix"],
+                "nom": p["nom"],
+                "categorie": p["categorie"]
+            }
+            for p in aleatoire.sample(produits, k=aleatoire.randint(1, 10))
+        ]
+        commandes.append({
+            "_id": f"{536000 + i}",
+            "client_id": aleatoire.choice(clients)["_id"],
+            "produits": lignes,
+            "date": DEBUT + timedelta(seconds=aleatoire.randrange(secondes)),
+            "montant_total": round(sum(l["prix_unitaire"] * l["quantite"] for l in lignes), 2)
+        })
+    db.commandes.insert_many(commandes)
+
+    creer_index(db)
+    reconstruire_registre(db)
+    calculer_clients_stats(db)
+    return {"produits": nb_produits, "clients": nb_clients, "commandes": nb_commandes}
+
+
+if __name__ == "__main__":
+    base = sys.argv[1] if len(sys.argv) > 1 else "ecommerce_perf"
+    nb_commandes = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    print(f"Base {base} générée :", generer(get_client()[base], nb_commandes=nb_commandes))
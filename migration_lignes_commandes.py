@@ -0,0 +1,54 @@
+# Fichier : migration_lignes_commandes.py
+# Dénormalise les lignes des commandes existantes : ajoute à chaque ligne le prix unitaire,
+# le nom et la catégorie du produit, pour que les agrégations se passent de $lookup.
+from pymongo import UpdateOne
+from cache import vider_cache
+from database import get_db
+from categories import CATEGORIE_PAR_DEFAUT
+
+TAILLE_LOT = 1000
+
+
+def migrer_lignes_commandes(db):
+    produits = {p['_id']: p for p in db.produits.find({}, {"nom": 1, "categorie": 1, "prix": 1})}
+
+    # Seules les commandes ayant au moins une ligne non migrée sont relues
+    a_migrer = db.commandes.find(
+        {"produits": {"$elemMatch": {"prix_unitaire": {"$exists": False}}}},
+        {"produits": 1}
+    )
+
+    operations = []
+    nombre_commandes = 0
+    for commande in a_migrer:
+        lignes = []
+        for ligne in commande['produits']:
+            # Les StockCode numériques du CSV ont pu être importés comme entiers
+            prod = produits.get(ligne['produit_id']) or produits.get(str(ligne['produit_id']))
+            if prod is not None:
+                # Le prix facturé n'a pas été conservé pour les anciennes commandes :
+                # on retient le prix catalogue au moment de la migration
+                ligne.setdefault('prix_unitaire', prod['prix'])
+                ligne.setdefault('nom', prod['nom'])
+                ligne.setdefault('categorie', prod['categorie'])
+            elif 'prix_unitaire' not in ligne:
+                # Produit absent du catalogue : valeurs par défaut explicites, pour que la ligne
+                # ne soit plus relue à chaque migration et que les lecteurs n'aient pas à la filtrer
+                ligne['prix_unitaire'] = 0
+                ligne.setdefault('nom', str(ligne['produit_id']))
+                ligne.setdefault('categorie', CATEGORIE_PAR_DEFAUT)
+                ligne['produit_inconnu'] = True
+            lignes.append(ligne)
+        operations.append(UpdateOne({"_id": commande['_id']}, {"$set": {"produits": lignes}}))
+        if len(operations) >= TAILLE_LOT:
+            nombre_commandes += db.commandes.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        nombre_commandes += db.commandes.bulk_write(operations, ordered=False).modified_count
+
+    vider_cache()
+    return nombre_commandes
+
+
+if __name__ == "__main__":
+    print(f"Commandes migrées : {migrer_lignes_commandes(get_db())}")
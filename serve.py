@@ -0,0 +1,68 @@
+# Fichier : serve.py
+# Point d'entrée de production : lance le dashboard Dash et l'API FastAPI
+# sous gunicorn, chacun avec plusieurs processus workers.
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+
+def commandes_gunicorn(args):
+    dashboard = [
+        sys.executable, "-m", "gunicorn", "dashboard:server",
+        "--workers", str(args.workers),
+        "--bind", f"{args.host}:{args.port_dashboard}",
+        "--timeout", str(args.timeout)
+    ]
+    api = [
+        sys.executable, "-m", "gunicorn", "api:app",
+        "--workers", str(args.workers),
+        "--worker-class", "uvicorn.workers.UvicornWorker",
+        "--bind", f"{args.host}:{args.port_api}",
+        "--timeout", str(args.timeout)
+    ]
+    return {"dashboard": dashboard, "api": api}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur de production du dashboard et de l'API e-commerce")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("ECOMMERCE_WORKERS", multiprocessing.cpu_count())),
+                        help="Nombre de processus workers par application (défaut : nombre de coeurs)")
+    parser.add_argument("--host", default=os.environ.get("ECOMMERCE_HOST", "0.0.0.0"))
+    parser.add_argument("--port-dashboard", type=int, default=8050)
+    parser.add_argument("--port-api", type=int, default=8000)
+    parser.add_argument("--timeout", type=int, default=120,
+                        help="Délai maximal (s) d'une requête avant redémarrage du worker")
+    parser.add_argument("--seulement", choices=["dashboard", "api"],
+                        help="Ne lancer qu'une des deux applications")
+    args = parser.parse_args()
+
+    commandes = commandes_gunicorn(args)
+    if args.seulement:
+        commandes = {args.seulement: commandes[args.seulement]}
+
+    # Tous les workers partagent le même répertoire de cache (voir cache.py)
+    processus = {nom: subprocess.Popen(cmd) for nom, cmd in commandes.items()}
+    print(f"Lancé avec {args.workers} workers : {', '.join(processus)}")
+
+    # Si une application s'arrête, on arrête les autres
+    try:
+        while all(p.poll() is None for p in processus.values()):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processus.values():
+            if p.poll() is None:
+                p.terminate()
+        for p in processus.values():
+            p.wait()
+
+    return max(p.returncode or 0 for p in processus.values())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# Fichier : stocks.py
+# Registre des stocks : une collection mouvements_stock (un mouvement par ligne de commande,
+# avec le solde du produit après ce mouvement) et une collection stocks qui tient le solde
+# courant de chaque produit. Les deux sont mises à jour en lot à l'import / à l'ingestion,
+# les lectures sont ensuite des requêtes ponctuelles sur index.
+# Plusieurs mouvements d'un produit peuvent avoir la même date (même StockCode deux fois sur
+# une facture, factures à la minute près) : un numéro d'ordre croissant, seq, les départage.
+from pymongo import InsertOne, UpdateOne, ASCENDING, DESCENDING
+from cache import vider_cache
+from database import get_db, PONCTUELLE, LISTE, ANALYTIQUE, MAX_TIME_MS
+
+SEUIL_STOCK_FAIBLE = 10
+TAILLE_LOT = 1000
+
+
+def creer_index_stocks(db):
+    # Index d'avant le numéro d'ordre : ils ne départagent pas les mouvements de même date
+    index_existants = db.mouvements_stock.index_information()
+    for nom in ("produit_id_1_date_-1", "date_1"):
+        if nom in index_existants:
+            db.mouvements_stock.drop_index(nom)
+    db.mouvements_stock.create_index([("produit_id", ASCENDING), ("date", DESCENDING), ("seq", DESCENDING)])
+    db.mouvements_stock.create_index([("date", ASCENDING), ("seq", ASCENDING)])
+    db.stocks.create_index([("stock", ASCENDING)])
+
+
+def enregistrer_ventes(db, commandes):
+    # Ingestion incrémentale : les soldes partent du stock courant, seules les commandes qui ne
+    # précèdent pas le dernier mouvement enregistré peuvent donc être ajoutées. Les commandes plus
+    # anciennes sont ignorées (reconstruire_registre les intègre), de même que celles déjà
+    # enregistrées : rejouer un lot ne double pas ses mouvements.
+    commandes = sorted((c for c in commandes if c.get('date') is not None), key=lambda c: c['date'])
+    dernier = db.mouvements_stock.find_one({}, {"date": 1, "seq": 1}, sort=[("date", DESCENDING), ("seq", DESCENDING)],
+                                           max_time_ms=MAX_TIME_MS[PONCTUELLE])
+    if dernier:
+        commandes = [c for c in commandes if c['date'] >= dernier['date']]
+        # Seules les commandes à la date du dernier mouvement peuvent déjà être au registre
+        meme_date = [c['_id'] for c in commandes if c['date'] == dernier['date']]
+        if meme_date:
+            deja_enregistrees = set(db.mouvements_stock.distinct(
+                "commande_id", {"date": dernier['date'], "commande_id": {"$in": meme_date}}))
+            commandes = [c for c in commandes if c['_id'] not in deja_enregistrees]
+
+    produit_ids = {ligne['produit_id'] for c in commandes for ligne in c['produits']}
+    if not produit_ids:
+        return 0
+
+    # Une seule lecture des soldes courants pour tout le lot
+    soldes = {s['_id']: s['stock']
+              for s in db.stocks.find({"_id": {"$in": list(produit_ids)}}, {"stock": 1},
+                                      max_time_ms=MAX_TIME_MS[LISTE])}
+
+    # Les numéros d'ordre reprennent après le dernier mouvement enregistré
+    seq = dernier.get('seq', -1) + 1 if dernier else 0
+
+    mouvements = []
+    variations = {}
+    for commande in commandes:
+        for ligne in commande['produits']:
+            produit_id = ligne['produit_id']
+            if produit_id not in soldes:
+                continue
+            soldes[produit_id] -= ligne['quantite']
+            variations[produit_id] = variations.get(produit_id, 0) - ligne['quantite']
+            mouvements.append(InsertOne({
+                "produit_id": produit_id,
+                "nom": ligne.get('nom'),
+                "date": commande['date'],
+                "commande_id": commande['_id'],
+                "quantite": -ligne['quantite'],
+                "solde": soldes[produit_id],
+                "seq": seq
+            }))
+            seq += 1
+
+    if mouvements:
+        db.mouvements_stock.bulk_write(mouvements, ordered=False)
+        db.stocks.bulk_write([
+            UpdateOne({"_id": produit_id}, {"$inc": {"stock": variation}})
+            for produit_id, variation in variations.items()
+        ], ordered=False)
+        # /stocks, les agrégations et le dashboard lisent le registre à travers le cache
+        vider_cache()
+    return len(mouvements)
+
+
+def reconstruire_registre(db):
+    # Repart du stock initial du catalogue et rejoue toutes les commandes par ordre chronologique
+    db.stocks.drop()
+    db.mouvements_stock.drop()
+    creer_index_stocks(db)
+
+    stocks = [
+        {"_id": p['_id'], "nom": p['nom'], "categorie": p['categorie'],
+         "stock_initial": p['stock'], "stock": p['stock']}
+        for p in db.produits.find({}, {"nom": 1, "categorie": 1, "stock": 1})
+    ]
+    if stocks:
+        db.stocks.insert_many(stocks)
+
+    nombre = 0
+    lot = []
+    for commande in db.commandes.find({"date": {"$ne": None}}, {"date": 1, "produits": 1}).sort("date", ASCENDING):
+        lot.append(commande)
+        if len(lot) >= TAILLE_LOT:
+            nombre += enregistrer_ventes(db, lot)
+            lot = []
+    if lot:
+        nombre += enregistrer_ventes(db, lot)
+
+    vider_cache()
+    return nombre
+
+
+def stock_actuel(db, produit_id):
+    stock = db.stocks.find_one({"_id": produit_id}, {"stock": 1}, max_time_ms=MAX_TIME_MS[PONCTUELLE])
+    return stock['stock'] if stock else None
+
+
+def stock_a_date(db, produit_id, date):
+    # Dernier mouvement avant la date : son solde est le stock à cette date
+    mouvement = db.mouvements_stock.find_one(
+        {"produit_id": produit_id, "date": {"$lte": date}},
+        {"solde": 1},
+        sort=[("date", DESCENDING), ("seq", DESCENDING)],
+        max_time_ms=MAX_TIME_MS[PONCTUELLE]
+    )
+    if mouvement:
+        return mouvement['solde']
+    stock = db.stocks.find_one({"_id": produit_id}, {"stock_initial": 1}, max_time_ms=MAX_TIME_MS[PONCTUELLE])
+    return stock['stock_initial'] if stock else None
+
+
+def stocks_a_date(db, date, produit_id=None):
+    # Stock à la date de tous les produits (ou d'un seul) : {produit_id: (nom, stock)}
+    filtre = {} if produit_id is None else {"_id": produit_id}
+    stocks = list(db.stocks.find(filtre, {"nom": 1, "stock_initial": 1, "stock": 1}, max_time_ms=MAX_TIME_MS[LISTE]))
+
+    # Aucun mouvement après la date : le solde courant est le stock à la date
+    filtre_mouvements = {} if produit_id is None else {"produit_id": produit_id}
+    dernier = db.mouvements_stock.find_one(filtre_mouvements, {"date": 1}, sort=[("date", DESCENDING)],
+                                           max_time_ms=MAX_TIME_MS[PONCTUELLE])
+    if dernier is None or date >= dernier['date']:
+        return {s['_id']: (s['nom'], s['stock']) for s in stocks}
+
+    # Sinon, dernier mouvement de chaque produit avant la date : $sort sur l'index
+    # (produit_id, date, seq) puis $first, exécuté en DISTINCT_SCAN (une lecture par produit
+    # au lieu de tout l'historique antérieur à la date)
+    resultat = {s['_id']: (s['nom'], s['stock_initial']) for s in stocks}
+    match = {"date": {"$lte": date}}
+    if produit_id is not None:
+        match["produit_id"] = produit_id
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"produit_id": 1, "date": -1, "seq": -1}},
+        {"$group": {"_id": "$produit_id", "solde": {"$first": "$solde"}}}
+    ]
+    for mouvement in db.mouvements_stock.aggregate(pipeline, maxTimeMS=MAX_TIME_MS[ANALYTIQUE]):
+        if mouvement['_id'] in resultat:
+            resultat[mouvement['_id']] = (resultat[mouvement['_id']][0], mouvement['solde'])
+    return resultat
+
+
+def mouvements_periode(db, debut, fin, produit_id=None):
+    filtre = {"date": {"$gte": debut, "$lte": fin}}
+    if produit_id is not None:
+        filtre["produit_id"] = produit_id
+    return list(db.mouvements_stock.find(filtre, {"_id": 0, "produit_id": 1, "nom": 1, "date": 1, "solde": 1},
+                                         max_time_ms=MAX_TIME_MS[ANALYTIQUE])
+                .sort([("date", ASCENDING), ("seq", ASCENDING)]))
+
+
+def alertes_stock_faible(db, seuil=SEUIL_STOCK_FAIBLE):
+    return list(db.stocks.find({"stock": {"$lt": seuil}}, {"nom": 1, "categorie": 1, "stock": 1},
+                               max_time_ms=MAX_TIME_MS[LISTE])
+                .sort("stock", ASCENDING))
+
+
+if __name__ == "__main__":
+    print(f"Mouvements enregistrés : {reconstruire_registre(get_db())}")
@@ -0,0 +1,30 @@
+# Fichier : test_analytique_clients.py
+# Notes RFM : calculées sans base, à partir de séries pandas.
+import random
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pymongo")
+
+from analytique_clients import score_quintile
+
+
+def test_score_quintile_valeurs_egales():
+    frequences = [1] * 40 + [2] * 30 + [5] * 30
+    notes = score_quintile(pd.Series(frequences))
+    par_valeur = {f: set(notes[pd.Series(frequences) == f]) for f in set(frequences)}
+    assert par_valeur == {1: {1}, 2: {3}, 5: {4}}
+
+
+def test_score_quintile_independant_de_l_ordre():
+    frequences = [1] * 40 + [2] * 30 + [5] * 30
+    melangees = list(frequences)
+    random.Random(1).shuffle(melangees)
+    notes = dict(zip(melangees, score_quintile(pd.Series(melangees))))
+    assert notes == dict(zip(frequences, score_quintile(pd.Series(frequences))))
+
+
+def test_score_quintile_valeurs_distinctes():
+    notes = score_quintile(pd.Series(range(100)))
+    assert list(notes) == [1] * 20 + [2] * 20 + [3] * 20 + [4] * 20 + [5] * 20
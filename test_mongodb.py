@@ -1,7 +1,11 @@
-import pymongo
+def verifier_connexion():
+    from database import get_client, MONGO_URI
+    try:
+        client = get_client()
+        print(f"Connexion réussie à {MONGO_URI} ! Bases disponibles :", client.list_database_names())
+    except Exception as e:
+        print("Erreur de connexion :", e)
 
-try:
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    print("Connexion réussie ! Bases disponibles :", client.list_database_names())
-except Exception as e:
-    print("Erreur de connexion :", e)
\ No newline at end of file
+
+if __name__ == '__main__':
+    verifier_connexion()
@@ -0,0 +1,275 @@
+# Fichier : test_performance.py
+# Tests de performance sur une base locale générée (jeu_de_donnees.py) : plan d'exécution
+# de chaque requête (index utilisé, documents examinés / renvoyés), nombre de commandes
+# MongoDB par requête utilisateur (détection des N+1) et budgets de latence.
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+pytest.importorskip("pandas")
+pytest.importorskip("diskcache")
+pytest.importorskip("dash")
+pytest.importorskip("fastapi")
+
+from datetime import datetime
+from pymongo import monitoring
+
+BASE_TEST = "ecommerce_perf"
+NB_COMMANDES = 10000
+# Multiplicateur des budgets de latence, pour les machines plus lentes
+FACTEUR_LATENCE = float(os.environ.get("ECOMMERCE_PERF_FACTEUR", 1))
+# Nombre maximal de clés d'index et de documents lus par document renvoyé, pour la partie
+# filtrée d'une requête (find filtré, $match de tête d'un pipeline)
+RATIO_EXAMINES_MAX = 2
+ETAPES_INDEX = {"IXSCAN", "IDHACK", "DISTINCT_SCAN", "COUNT_SCAN",
+                "EXPRESS_IXSCAN", "EXPRESS_IDHACK", "EXPRESS_CLUSTERED_IXSCAN"}
+COMMANDES_IGNOREES = {"getMore", "killCursors", "explain", "endSessions"}
+
+
+class EcouteurCommandes(monitoring.CommandListener):
+    def __init__(self):
+        self.actif = False
+        self.commandes = []
+
+    def started(self, event):
+        if self.actif and event.database_name == BASE_TEST and event.command_name not in COMMANDES_IGNOREES:
+            self.commandes.append((event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Doit être enregistré avant la création du client MongoDB partagé (database.get_client)
+ecouteur = EcouteurCommandes()
+monitoring.register(ecouteur)
+
+
+@pytest.fixture(scope="module")
+def modules():
+    import database
+    # Base dédiée et cache isolé, vidé avant chaque mesure : jamais le ECOMMERCE_CACHE_DIR de
+    # l'environnement, que executer() viderait. Les deux ne valent que le temps du module.
+    if "cache" in sys.modules:
+        pytest.fail(f"cache.py importé avant test_performance.py : le cache {sys.modules['cache'].CACHE_DIR} "
+                    f"serait vidé")
+    dossier_cache = tempfile.mkdtemp(prefix="ecommerce_perf_cache_")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("ECOMMERCE_CACHE_DIR", dossier_cache)
+        # database.py a pu être importé avant ce module (autre test, conftest) : NOM_BASE est alors
+        # figé et le client partagé créé sans l'écouteur. On force la base de test et un nouveau client.
+        patch.setattr(database, "NOM_BASE", BASE_TEST)
+        database.fermer_client()
+        import cache
+        try:
+            db = database.get_client()[BASE_TEST]
+            try:
+                db.client.server_info()
+            except pymongo.errors.ServerSelectionTimeoutError:
+                pytest.skip(f"MongoDB n'est pas disponible ({database.MONGO_URI})")
+
+            from jeu_de_donnees import generer
+            generer(db, nb_commandes=NB_COMMANDES)
+
+            import aggregations
+            import api
+            import dashboard
+            yield {"db": db, "aggregations": aggregations, "api": api, "dashboard": dashboard}
+            db.client.drop_database(BASE_TEST)
+        finally:
+            database.fermer_client()
+            cache.cache.close()
+            cache.callback_cache.close()
+            shutil.rmtree(dossier_cache, ignore_errors=True)
+
+
+def sans_progression(*args):
+    pass
+
+
+# (nom, appel, commandes MongoDB maximales, latence maximale en secondes)
+DEBUT, FIN = datetime(2011, 1, 1), datetime(2011, 6, 30)
+SCENARIOS = [
+    ("ventes_par_periode", lambda m: m["aggregations"].ventes_par_periode(DEBUT, FIN), 1, 0.5),
+    ("ventes_par_produit", lambda m: m["aggregations"].ventes_par_produit(), 1, 1.0),
+    ("ventes_par_categorie", lambda m: m["aggregations"].ventes_par_categorie(), 1, 1.0),
+    ("calculer_metrics", lambda m: m["aggregations"].calculer_metrics(DEBUT, FIN), 1, 0.5),
+    ("stocks_restants", lambda m: m["aggregations"].stocks_restants(), 1, 0.2),
+    ("api_ventes", lambda m: m["api"].get_ventes(m["api"].VentesQuery()), 1, 1.0),
+    ("api_ventes_client", lambda m: m["api"].get_ventes(m["api"].VentesQuery(client_id=12001)), 1, 0.2),
+    ("api_ventes_periode", lambda m: m["api"].get_ventes(
+        m["api"].VentesQuery(start_date="2011-01-01", end_date="2011-06-30", produit_id="20001")), 1, 0.5),
+    ("api_stocks", lambda m: m["api"].get_stocks(), 1, 0.2),
+    ("api_alertes_stock", lambda m: m["api"].get_alertes_stock(), 1, 0.2),
+    ("api_clients_classement", lambda m: m["api"].get_clients_stats(), 1, 0.2),
+    ("api_clients_segment", lambda m: m["api"].get_clients_stats(segment="Champions", tri="recence"), 1, 0.2),
+    ("api_client_stats", lambda m: m["api"].get_client_stats(12001), 1, 0.1),
+    ("dashboard_catalogue", lambda m: m["dashboard"].charger_catalogue(), 2, 0.3),
+    ("dashboard_periode", lambda m: m["dashboard"].update_dashboard(
+        sans_progression, None, "2011-01-01T00:00:00", "2011-06-30T00:00:00", None, None), 5, 3.0),
+    ("dashboard_client", lambda m: m["dashboard"].update_dashboard(
+        sans_progression, 12001, "2010-12-01T00:00:00", "2011-12-09T00:00:00", None, None), 4, 1.5),
+    ("dashboard_produit", lambda m: m["dashboard"].update_dashboard(
+        sans_progression, None, "2010-12-01T00:00:00", "2011-12-09T00:00:00", "20001", None), 4, 1.0),
+    ("dashboard_segment", lambda m: m["dashboard"].update_client_options("Champions"), 1, 0.2),
+    ("dashboard_fiche_client", lambda m: m["dashboard"].update_client_stats(12001), 1, 0.1),
+    ("export_csv", lambda m: m["dashboard"].export_to_csv(
+        1, None, "2011-06-01T00:00:00", "2011-06-30T00:00:00", None, None), 1, 1.5),
+]
+
+
+def executer(modules, appel):
+    modules["dashboard"].cache.clear()
+    ecouteur.commandes = []
+    ecouteur.actif = True
+    debut = time.perf_counter()
+    try:
+        appel(modules)
+    finally:
+        ecouteur.actif = False
+    return time.perf_counter() - debut, list(ecouteur.commandes)
+
+
+def etapes(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for cle in ("inputStage", "queryPlan"):
+            if cle in plan:
+                yield from etapes(plan[cle])
+        for sous_plan in plan.get("inputStages", []):
+            yield from etapes(sous_plan)
+
+
+def analyser_explain(explain):
+    # Parcourt l'explain (find ou aggregate, moteur classique ou SBE) et renvoie
+    # les étapes des plans retenus et les statistiques d'exécution
+    plans, stats = [], []
+    a_visiter = [explain]
+    while a_visiter:
+        noeud = a_visiter.pop()
+        if isinstance(noeud, dict):
+            if "winningPlan" in noeud:
+                plans.append(set(etapes(noeud["winningPlan"])))
+            if "executionStats" in noeud:
+                stats.append(noeud["executionStats"])
+            a_visiter.extend(noeud.values())
+        elif isinstance(noeud, list):
+            a_visiter.extend(noeud)
+    return plans, stats
+
+
+def sans_filtre(nom, commande):
+    # Lecture de toute la collection (catalogue, agrégat global) : un COLLSCAN est attendu
+    if nom == "find":
+        return not commande.get("filter")
+    pipeline = commande.get("pipeline", [])
+    return not pipeline or "$match" not in pipeline[0] or not pipeline[0]["$match"]
+
+
+def expliquer(db, nom, commande):
+    commande = {cle: valeur for cle, valeur in commande.items() if not cle.startswith("$") and cle != "lsid"}
+    return db.command({"explain": commande, "verbosity": "executionStats"})
+
+
+def lecture_filtree(nom, commande):
+    # Partie filtrée de la requête, sous forme de find : le find lui-même, ou le $match de
+    # tête d'un pipeline. Les étapes suivantes ($group, $unwind...) ne renvoient pas des
+    # documents de la collection : leur nReturned (groupes sous SBE, documents en entrée du
+    # $group avec le moteur classique) ne mesure pas la sélectivité de l'index.
+    if sans_filtre(nom, commande):
+        return None
+    if nom == "find":
+        return {cle: commande[cle] for cle in ("find", "filter", "sort", "limit", "projection") if cle in commande}
+    return {"find": commande["aggregate"], "filter": commande["pipeline"][0]["$match"]}
+
+
+@pytest.mark.parametrize("nom, appel, max_commandes, max_latence", SCENARIOS, ids=[s[0] for s in SCENARIOS])
+def test_plans_et_nombre_de_commandes(modules, nom, appel, max_commandes, max_latence):
+    _, commandes = executer(modules, appel)
+
+    assert 0 < len(commandes) <= max_commandes, \
+        f"{nom} : {len(commandes)} commandes MongoDB ({[c[0] for c in commandes]})"
+
+    for nom_commande, commande in commandes:
+        if nom_commande not in ("find", "aggregate"):
+            continue
+        plans, _ = analyser_explain(expliquer(modules["db"], nom_commande, commande))
+        assert plans, f"{nom} : pas de plan pour {commande}"
+        lecture = lecture_filtree(nom_commande, commande)
+        if lecture is None:
+            continue
+        for plan in plans:
+            assert plan & ETAPES_INDEX, f"{nom} : requête sans index {plan} pour {commande}"
+        _, stats = analyser_explain(expliquer(modules["db"], "find", lecture))
+        for stat in stats:
+            limite = max(stat["nReturned"], 1) * RATIO_EXAMINES_MAX
+            assert stat["totalKeysExamined"] <= limite and stat["totalDocsExamined"] <= limite, \
+                f"{nom} : {stat['totalKeysExamined']} clés et {stat['totalDocsExamined']} documents " \
+                f"examinés pour {stat['nReturned']} renvoyés ({lecture})"
+
+
+def test_stocks_a_date_borne_par_produit(modules):
+    from stocks import stocks_a_date
+    db = modules["db"]
+    nb_produits = db.stocks.count_documents({})
+
+    # Date postérieure au dernier mouvement : lecture directe des soldes courants
+    _, commandes = executer(modules, lambda m: stocks_a_date(db, datetime(2012, 1, 1)))
+    assert [c[0] for c in commandes] == ["find", "find"], commandes
+
+    # Date dans l'historique : un mouvement lu par produit, pas tout l'historique antérieur
+    _, commandes = executer(modules, lambda m: stocks_a_date(db, DEBUT))
+    agregats = [c for nom_commande, c in commandes if nom_commande == "aggregate"]
+    assert len(agregats) == 1, commandes
+    plans, stats = analyser_explain(expliquer(db, "aggregate", agregats[0]))
+    assert any("DISTINCT_SCAN" in plan for plan in plans), plans
+    for stat in stats:
+        assert stat["totalKeysExamined"] <= 2 * nb_produits and stat["totalDocsExamined"] <= 2 * nb_produits, \
+            f"{stat['totalKeysExamined']} clés et {stat['totalDocsExamined']} documents examinés " \
+            f"pour {nb_produits} produits"
+
+
+def test_registre_mouvements_de_meme_date_et_lot_rejoue(modules):
+    # Un produit deux fois sur la même facture : le stock à cette date est le solde après la
+    # seconde ligne, même quand un mouvement plus récent force la lecture de l'historique
+    from stocks import enregistrer_ventes, stock_a_date, stocks_a_date, stock_actuel
+    db = modules["db"]
+    produit_id = "20001"
+    facture, suivante = datetime(2012, 1, 2, 10, 30), datetime(2012, 1, 3, 9, 0)
+    commandes = [
+        {"_id": "test-egalite-1", "date": facture,
+         "produits": [{"produit_id": produit_id, "quantite": 2}, {"produit_id": produit_id, "quantite": 3}]},
+        {"_id": "test-egalite-2", "date": suivante, "produits": [{"produit_id": produit_id, "quantite": 1}]},
+    ]
+    avant = stock_actuel(db, produit_id)
+    try:
+        enregistrer_ventes(db, commandes)
+        assert stock_a_date(db, produit_id, facture) == avant - 5
+        assert stocks_a_date(db, facture, produit_id)[produit_id][1] == avant - 5
+        assert stocks_a_date(db, facture)[produit_id][1] == avant - 5
+        assert stock_actuel(db, produit_id) == avant - 6
+
+        # Lot rejoué, puis commande antérieure au dernier mouvement : ignorés
+        assert enregistrer_ventes(db, commandes) == 0
+        ancienne = {"_id": "test-egalite-3", "date": facture, "produits": [{"produit_id": produit_id, "quantite": 4}]}
+        assert enregistrer_ventes(db, [ancienne]) == 0
+        assert stock_actuel(db, produit_id) == avant - 6
+        assert db.mouvements_stock.count_documents({"produit_id": produit_id, "date": {"$gte": facture}}) == 3
+    finally:
+        db.mouvements_stock.delete_many({"commande_id": {"$regex": "^test-egalite-"}})
+        db.stocks.update_one({"_id": produit_id}, {"$set": {"stock": avant}})
+
+
+@pytest.mark.parametrize("nom, appel, max_commandes, max_latence", SCENARIOS, ids=[s[0] for s in SCENARIOS])
+def test_latence(modules, nom, appel, max_commandes, max_latence):
+    executer(modules, appel)  # Préchauffage du serveur (cache WiredTiger)
+    duree = min(executer(modules, appel)[0] for _ in range(3))
+    assert duree <= max_latence * FACTEUR_LATENCE, f"{nom} : {duree:.3f} s (budget {max_latence} s)"